@@ -5,25 +5,48 @@ Applies the Hugging Face model:
 j-hartmann/emotion-english-distilroberta-base
 
 This script assumes lyrics are already present in the dataset.
+Set EMOTION_SERVER_URL to score through a running emotion_server.py
+instead of loading the model locally.
 """
 
+import numpy as np
 import pandas as pd
-from transformers import pipeline
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import requests
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+import gc
 import logging
 import os
 import torch
-from typing import Dict
+from functools import partial
+from torch.utils.data import DataLoader
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional
 
 # Configuration
 INPUT_FILE = "lyrics_dataset.csv"
-OUTPUT_FILE = "lyrics_with_roberta_emotions.csv"
+OUTPUT_FILE = "lyrics_with_roberta_emotions.parquet"
 EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+ONNX_MODEL_DIR = "onnx_emotion_model"
+ONNX_QUANTIZED_DIR = "onnx_emotion_model_int8"
+QUANTIZE = os.getenv("EMOTION_QUANTIZE") == "1"  # INT8 on CPU only
+ATTN_IMPLEMENTATIONS = ["flash_attention_2", "sdpa", "eager"]
 MAX_TOKENS = 512
+PAD_TO_MULTIPLE_OF = 64  # Bounds the distinct shapes torch.compile sees
+BATCH_SIZE = 32  # Tune to 16/32/64 depending on available GPU memory
+CHUNK_SIZE = 2048  # Rows read, scored and written per step
+CSV_BLOCK_SIZE = 16 << 20  # Bytes parsed per pyarrow CSV block
+DATALOADER_WORKERS = 2  # Background tokenization processes (GPU only)
+EMOTION_SERVER_URL = os.getenv("EMOTION_SERVER_URL")  # e.g. http://127.0.0.1:8000
+SERVER_TIMEOUT = 600  # Seconds to wait for one chunk from the server
 
 EMOTION_LABELS = [
     "anger", "disgust", "fear",
     "joy", "neutral", "sadness", "surprise"
 ]
+LABEL_IDX = {label: i for i, label in enumerate(EMOTION_LABELS)}
+SCORE_COLUMNS = [f"score_{e}" for e in EMOTION_LABELS]
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,66 +54,344 @@ logging.basicConfig(
 )
 
 
-def load_data(input_file: str) -> pd.DataFrame:
+class EmotionClassifier(NamedTuple):
+    model: Any
+    tokenizer: Any
+    device: torch.device
+    label_columns: np.ndarray  # logit index -> EMOTION_LABELS index
+
+
+def iter_chunks(input_file: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Stream the dataset in row chunks to keep memory bounded."""
     if not os.path.exists(input_file):
         raise FileNotFoundError(f"{input_file} not found")
-    logging.info(f"Loading dataset: {input_file}")
-    return pd.read_csv(input_file, encoding="utf-8")
+    logging.info(f"Streaming dataset: {input_file}")
+
+    if input_file.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(input_file)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+        return
+
+    read_options = pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+    parse_options = pacsv.ParseOptions(newlines_in_values=True)
+
+    # Column types are inferred from the first block and then fixed for
+    # the rest of the file. Pin lyrics and any all-null columns to text
+    # so later blocks (and the Parquet writer's schema) stay compatible.
+    with pacsv.open_csv(
+        input_file,
+        read_options=read_options,
+        parse_options=parse_options
+    ) as reader:
+        inferred = reader.schema
+
+    column_types = {
+        field.name: pa.string()
+        for field in inferred
+        if field.name == "lyrics" or pa.types.is_null(field.type)
+    }
+
+    with pacsv.open_csv(
+        input_file,
+        read_options=read_options,
+        parse_options=parse_options,
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            strings_can_be_null=True
+        )
+    ) as reader:
+        for batch in reader:
+            for offset in range(0, batch.num_rows, chunk_size):
+                yield batch.slice(offset, chunk_size).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def append_chunk(
+    df: pd.DataFrame,
+    output_file: str,
+    writer: Optional[pq.ParquetWriter],
+    first: bool
+) -> Optional[pq.ParquetWriter]:
+    """
+    Append a scored chunk to the output file.
+    Parquet output shares one ParquetWriter, opened on the first chunk.
+    """
+    if not output_file.endswith(".parquet"):
+        df.to_csv(
+            output_file,
+            mode="w" if first else "a",
+            header=first,
+            index=False,
+            encoding="utf-8"
+        )
+        return None
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if writer is None:
+        writer = pq.ParquetWriter(output_file, table.schema, compression="zstd")
+    else:
+        table = table.cast(writer.schema)
+    writer.write_table(table)
+    return writer
+
+
+def load_gpu_model():
+    """
+    Load the model in FP16, using the fastest attention
+    implementation available (FlashAttention-2, then SDPA).
+    """
+    for attn in ATTN_IMPLEMENTATIONS:
+        try:
+            model = AutoModelForSequenceClassification.from_pretrained(
+                EMOTION_MODEL,
+                torch_dtype=torch.float16,
+                attn_implementation=attn
+            )
+            logging.info(f"Using attention implementation: {attn}")
+            return model
+        except (ImportError, ValueError) as e:
+            logging.debug(f"{attn} unavailable: {e}")
+
+    raise RuntimeError("No supported attention implementation found")
 
 
-def analyze_emotions(classifier, text: str) -> Dict[str, float]:
-    if not isinstance(text, str) or not text.strip():
-        return {f"score_{e}": None for e in EMOTION_LABELS}
+def build_classifier(model, tokenizer, device: torch.device) -> EmotionClassifier:
+    id2label = model.config.id2label
+    label_columns = np.array([
+        LABEL_IDX[id2label[i].lower()] for i in range(len(id2label))
+    ])
+    return EmotionClassifier(model, tokenizer, device, label_columns)
+
+
+def compile_classifier(classifier: EmotionClassifier) -> EmotionClassifier:
+    """
+    Wrap the model in torch.compile and run one warm-up batch, since
+    compilation only happens on the first forward call. Falls back to
+    the eager model if compilation fails.
+    """
+    compiled = classifier._replace(
+        model=torch.compile(classifier.model, mode="reduce-overhead", dynamic=True)
+    )
+
+    try:
+        score_batch(compiled, tokenize_batch(classifier.tokenizer, ["warm-up"]))
+    except Exception as e:
+        logging.warning(f"torch.compile failed, using eager model: {e}")
+        return classifier
+
+    return compiled
+
+
+def load_classifier() -> EmotionClassifier:
+    """
+    Build the emotion classifier.
+    Uses FP16 PyTorch (compiled with torch.compile) on GPU; on CPU
+    prefers an ONNX Runtime export (cached in ONNX_MODEL_DIR) when
+    optimum is installed.
+    Set EMOTION_QUANTIZE=1 to quantize the CPU model to INT8.
+    """
+    if torch.cuda.is_available():
+        device = torch.device("cuda")
+        model = load_gpu_model().to(device).eval()
+        tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL)
+        classifier = build_classifier(model, tokenizer, device)
+        return compile_classifier(classifier)
+
+    device = torch.device("cpu")
 
     try:
-        results = classifier(
-            text,
-            top_k=None,
-            truncation=True,
-            max_length=MAX_TOKENS
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+    except ImportError:
+        logging.info("optimum not installed, using PyTorch on CPU")
+        model = AutoModelForSequenceClassification.from_pretrained(EMOTION_MODEL)
+        model.eval()
+        if QUANTIZE:
+            logging.info("Applying dynamic INT8 quantization...")
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL)
+        return build_classifier(model, tokenizer, device)
+
+    if os.path.isdir(ONNX_MODEL_DIR):
+        logging.info(f"Loading cached ONNX model: {ONNX_MODEL_DIR}")
+        model = ORTModelForSequenceClassification.from_pretrained(ONNX_MODEL_DIR)
+        tokenizer = AutoTokenizer.from_pretrained(ONNX_MODEL_DIR)
+    else:
+        logging.info("Exporting model to ONNX...")
+        model = ORTModelForSequenceClassification.from_pretrained(
+            EMOTION_MODEL,
+            export=True
+        )
+        tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL)
+        model.save_pretrained(ONNX_MODEL_DIR)
+        tokenizer.save_pretrained(ONNX_MODEL_DIR)
+
+    if QUANTIZE:
+        model = quantize_onnx_model(model, tokenizer)
+
+    return build_classifier(model, tokenizer, device)
+
+
+def quantize_onnx_model(model, tokenizer):
+    """
+    Dynamically quantize the ONNX export to INT8 (AVX512-VNNI),
+    caching the result in ONNX_QUANTIZED_DIR.
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    if not os.path.isdir(ONNX_QUANTIZED_DIR):
+        logging.info("Quantizing ONNX model to INT8...")
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantizer.quantize(
+            save_dir=ONNX_QUANTIZED_DIR,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(
+                is_static=False,
+                per_channel=False
+            )
         )
+        tokenizer.save_pretrained(ONNX_QUANTIZED_DIR)
+
+    logging.info(f"Loading INT8 ONNX model: {ONNX_QUANTIZED_DIR}")
+    return ORTModelForSequenceClassification.from_pretrained(
+        ONNX_QUANTIZED_DIR,
+        file_name="model_quantized.onnx"
+    )
+
+
+def tokenize_batch(tokenizer, texts: List[str]):
+    return tokenizer(
+        texts,
+        padding="longest",
+        pad_to_multiple_of=PAD_TO_MULTIPLE_OF,
+        truncation=True,
+        max_length=MAX_TOKENS,
+        return_tensors="pt"
+    )
 
-        scores = {f"score_{e}": 0.0 for e in EMOTION_LABELS}
 
-        for r in results:
-            label = r["label"].lower()
-            if label in EMOTION_LABELS:
-                scores[f"score_{label}"] = r["score"]
+@torch.inference_mode()
+def score_batch(classifier: EmotionClassifier, inputs) -> np.ndarray:
+    """Return softmax probabilities in the model's own label order."""
+    inputs = {
+        key: value.to(classifier.device, non_blocking=True)
+        for key, value in inputs.items()
+    }
 
+    logits = classifier.model(**inputs).logits
+    return logits.float().softmax(-1).cpu().numpy()
+
+
+def analyze_emotions(classifier: EmotionClassifier, texts: List[str]) -> np.ndarray:
+    """
+    Score a list of lyrics in length-sorted, padded batches.
+    On GPU, batches are tokenized by DataLoader workers while the
+    previous batch runs through the model.
+    Returns an (n, 7) matrix ordered like EMOTION_LABELS;
+    rows with missing or empty lyrics are left as NaN.
+    """
+    scores = np.full((len(texts), len(EMOTION_LABELS)), np.nan, dtype=np.float32)
+
+    rows = [
+        i for i, text in enumerate(texts)
+        if isinstance(text, str) and text.strip()
+    ]
+    if not rows:
         return scores
 
-    except Exception as e:
-        logging.warning(f"Emotion analysis failed: {e}")
-        return {f"score_{e}": None for e in EMOTION_LABELS}
+    # Group similar-length lyrics into the same batch to minimise padding
+    lengths = classifier.tokenizer(
+        [texts[i] for i in rows],
+        truncation=True,
+        max_length=MAX_TOKENS,
+        return_length=True
+    )["length"]
+    rows = [rows[i] for i in np.argsort(lengths, kind="stable")]
 
+    batches = [rows[start:start + BATCH_SIZE] for start in range(0, len(rows), BATCH_SIZE)]
+    on_gpu = classifier.device.type == "cuda"
 
-def main():
-    logging.info("Initializing emotion classifier...")
-    classifier = pipeline(
-        "text-classification",
-        model=EMOTION_MODEL,
-        device=0 if torch.cuda.is_available() else -1
+    # batch_size=None: each item is already a batch, collate_fn tokenizes it
+    loader = DataLoader(
+        [[texts[i] for i in batch_rows] for batch_rows in batches],
+        batch_size=None,
+        collate_fn=partial(tokenize_batch, classifier.tokenizer),
+        num_workers=DATALOADER_WORKERS if on_gpu else 0,
+        pin_memory=on_gpu
     )
-    logging.info("✓ Model loaded")
 
-    df = load_data(INPUT_FILE)
+    for batch_rows, inputs in zip(batches, loader):
+        try:
+            probs = score_batch(classifier, inputs)
+        except Exception as e:
+            logging.warning(f"Emotion analysis failed: {e}")
+            continue
+
+        scores[np.ix_(batch_rows, classifier.label_columns)] = probs
+
+    return scores
 
+
+def score_remote(texts: List[str]) -> np.ndarray:
+    """Score lyrics through a running emotion_server.py."""
+    response = requests.post(
+        f"{EMOTION_SERVER_URL}/score",
+        json={"lyrics": texts},
+        timeout=SERVER_TIMEOUT
+    )
+    response.raise_for_status()
+
+    # null scores (empty lyrics) become NaN
+    scores = np.array(response.json()["scores"], dtype=np.float32)
+    return scores.reshape(len(texts), len(EMOTION_LABELS))
+
+
+def score_chunk(
+    score_fn: Callable[[List[str]], np.ndarray],
+    df: pd.DataFrame
+) -> pd.DataFrame:
     if "lyrics" not in df.columns:
         raise ValueError("Dataset must contain a 'lyrics' column")
 
+    texts = list(df["lyrics"].fillna("").astype(str))
+    scores = score_fn(texts)
+
+    emotion_df = pd.DataFrame(scores, columns=SCORE_COLUMNS)
+    return pd.concat([df.reset_index(drop=True), emotion_df], axis=1)
+
+
+def main():
+    if EMOTION_SERVER_URL:
+        logging.info(f"Using emotion server: {EMOTION_SERVER_URL}")
+        score_fn = score_remote
+    else:
+        logging.info("Initializing emotion classifier...")
+        score_fn = partial(analyze_emotions, load_classifier())
+        logging.info("✓ Model loaded")
+
     logging.info("Running emotion analysis...")
-    emotion_data = df["lyrics"].apply(
-        lambda x: analyze_emotions(classifier, x)
-    )
+    writer = None
+    total_rows = 0
+
+    try:
+        for index, chunk in enumerate(iter_chunks(INPUT_FILE, CHUNK_SIZE)):
+            scored = score_chunk(score_fn, chunk)
+            writer = append_chunk(scored, OUTPUT_FILE, writer, first=index == 0)
+
+            total_rows += len(scored)
+            logging.info(f"Scored {total_rows:,} rows")
 
-    emotion_df = pd.DataFrame(list(emotion_data))
-    final_df = pd.concat([df, emotion_df], axis=1)
+            del chunk, scored
+            gc.collect()
 
-    logging.info(f"Saving results to {OUTPUT_FILE}")
-    final_df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8")
+    finally:
+        if writer is not None:
+            writer.close()
 
+    logging.info(f"Results saved to {OUTPUT_FILE}")
     logging.info("✓ RoBERTa emotion scoring complete")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,105 @@
+"""
+RoBERTa Emotion Scoring Server
+
+Loads the emotion classifier from emotion_scorer_roberta.py once at
+startup, keeps it in a single long-lived worker and serves scores over
+HTTP, so repeated runs skip the model load. Requests that arrive while
+the model is busy are merged into the next scoring pass.
+
+Run with:
+    uvicorn emotion_server:app --host 127.0.0.1 --port 8000
+
+Then point the scorer at it:
+    EMOTION_SERVER_URL=http://127.0.0.1:8000 python emotion_scorer_roberta.py
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from emotion_scorer_roberta import (
+    EMOTION_LABELS,
+    EmotionClassifier,
+    analyze_emotions,
+    load_classifier
+)
+
+
+# =========================
+# Worker Loop
+# =========================
+
+async def server_loop(queue: asyncio.Queue, classifier: EmotionClassifier):
+    """Score queued jobs with the loaded classifier until cancelled."""
+    while True:
+        # Merge every job waiting in the queue into one scoring pass
+        jobs = [await queue.get()]
+        while not queue.empty():
+            jobs.append(queue.get_nowait())
+
+        texts = [text for job_texts, _ in jobs for text in job_texts]
+
+        try:
+            scores = await asyncio.to_thread(analyze_emotions, classifier, texts)
+        except Exception as e:
+            logging.error(f"Scoring failed: {e}")
+            for _, future in jobs:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        offset = 0
+        for job_texts, future in jobs:
+            if not future.done():
+                future.set_result(scores[offset:offset + len(job_texts)])
+            offset += len(job_texts)
+
+
+# =========================
+# HTTP Layer
+# =========================
+
+async def score(request: Request) -> JSONResponse:
+    payload = await request.json()
+    lyrics = payload.get("lyrics") if isinstance(payload, dict) else None
+
+    if not isinstance(lyrics, list):
+        return JSONResponse({"error": "Body must be {\"lyrics\": [...]}"}, status_code=400)
+
+    future = asyncio.get_running_loop().create_future()
+    await request.app.state.queue.put((lyrics, future))
+    scores = await future
+
+    return JSONResponse({
+        "labels": EMOTION_LABELS,
+        "scores": np.where(np.isnan(scores), None, scores).tolist()
+    })
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Load before serving so a failed load aborts startup
+    logging.info("Initializing emotion classifier...")
+    classifier = await asyncio.to_thread(load_classifier)
+    logging.info("✓ Model loaded")
+
+    app.state.queue = asyncio.Queue()
+    worker = asyncio.create_task(server_loop(app.state.queue, classifier))
+
+    yield
+
+    worker.cancel()
+    with suppress(asyncio.CancelledError):
+        await worker
+
+
+app = Starlette(
+    routes=[Route("/score", score, methods=["POST"])],
+    lifespan=lifespan
+)
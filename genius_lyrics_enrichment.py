@@ -3,17 +3,22 @@ Genius Lyrics Enrichment
 
 Fetches lyrics for all tracks using the Genius API
 and outputs a fully rebuilt dataset with lyrics included.
+Requests run concurrently behind a shared rate limiter.
 """
 
 import os
-import time
+import json
 import random
+import shelve
+import asyncio
 import logging
 import re
-from typing import Optional, List
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
 
+import aiohttp
 import pandas as pd
-import lyricsgenius
+from bs4 import BeautifulSoup
 
 
 # =========================
@@ -21,10 +26,25 @@ import lyricsgenius
 # =========================
 
 INPUT_FILE = "lyrics_emotion_analysis.xlsx"
-OUTPUT_FILE = "lyrics_enriched_tracks.xlsx"
+OUTPUT_FILE = "lyrics_enriched_tracks.csv"
+CACHE_FILE = ".genius_cache"  # shelve database of successful lookups
 
-MIN_DELAY = 1.0
-MAX_DELAY = 1.5
+GENIUS_API_URL = "https://api.genius.com"
+
+MAX_CONCURRENCY = 32
+MAX_REQUESTS_PER_SECOND = 4
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = 30
+
+# Section headers ([Verse], [Chorus], ...) and trailing "123Embed" footer
+_LYRICS_NOISE_RE = re.compile(r"\[.*?\]|\d*Embed$")
+
+# Search hits that are not actual songs
+_NON_SONG_RE = re.compile(
+    r"track\s?list|album art(work)?|liner notes|booklet|credits"
+    r"|interview|skit|instrumental|setlist",
+    re.IGNORECASE
+)
 
 
 # =========================
@@ -41,9 +61,9 @@ logging.basicConfig(
 # Authentication
 # =========================
 
-def authenticate_genius() -> lyricsgenius.Genius:
+def authenticate_genius() -> str:
     """
-    Authenticate using environment variable:
+    Read the API token from environment variable:
     GENIUS_ACCESS_TOKEN
     """
     token = os.getenv("GENIUS_ACCESS_TOKEN")
@@ -54,41 +74,31 @@ def authenticate_genius() -> lyricsgenius.Genius:
             "Set it as an environment variable."
         )
 
-    genius = lyricsgenius.Genius(token)
-    genius.remove_section_headers = True
-    genius.skip_non_songs = True
-
-    return genius
+    return token
 
 
 # =========================
 # Cleaning Utilities
 # =========================
 
-def clean_track_title(title: str) -> str:
+def clean_track_titles(titles: pd.Series) -> pd.Series:
     """Remove extra descriptors for better search results."""
-    if not isinstance(title, str):
-        return ""
-
-    cut_pos = len(title)
-    for sep in ["(", "-"]:
-        idx = title.find(sep)
-        if idx != -1:
-            cut_pos = min(cut_pos, idx)
+    titles = titles.astype("string").fillna("")
 
-    return title[:cut_pos].strip() or title.strip()
+    cleaned = titles.str.split(r"[(\-]", n=1, regex=True).str[0].str.strip()
 
+    return cleaned.mask(cleaned == "", titles.str.strip())
 
-def clean_artist_name(artist: str) -> str:
-    """Simplify artist name for search."""
-    if not isinstance(artist, str):
-        return ""
 
-    for sep in [",", "&", "feat.", "ft."]:
-        if sep in artist:
-            artist = artist.split(sep)[0]
+def clean_artist_names(artists: pd.Series) -> pd.Series:
+    """Simplify artist names for search."""
+    artists = artists.astype("string").fillna("")
 
-    return " ".join(artist.split()).strip()
+    return (
+        artists.str.split(r",|&|feat\.|ft\.", n=1, regex=True).str[0]
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
 
 
 def clean_lyrics(text: str, track_name: str) -> str:
@@ -101,47 +111,221 @@ def clean_lyrics(text: str, track_name: str) -> str:
     if search_term in text:
         text = text.split(search_term, 1)[1]
 
-    # Remove embed/footer noise
-    text = re.sub(r"\d*Embed$", "", text)
-
-    # Remove section headers [Verse], [Chorus], etc.
-    text = re.sub(r"\[.*?\]", "", text)
+    # Remove section headers and embed/footer noise in a single pass
+    text = _LYRICS_NOISE_RE.sub("", text)
 
     return text.strip()
 
 
+# =========================
+# I/O
+# =========================
+
+def load_dataset(path: str) -> pd.DataFrame:
+    """Read a CSV, Parquet or Excel dataset based on its extension."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".csv"):
+        return pd.read_csv(path, encoding="utf-8", engine="pyarrow")
+    return pd.read_excel(path)
+
+
+def save_dataset(df: pd.DataFrame, path: str):
+    """Write a CSV or Parquet dataset based on its extension."""
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False, compression="zstd")
+    else:
+        df.to_csv(path, index=False, encoding="utf-8")
+
+
 # =========================
 # Fetch Layer
 # =========================
 
-def fetch_lyrics(
-    genius: lyricsgenius.Genius,
+class RateLimiter:
+    """Space out request start times to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def genius_get(
+    session: aiohttp.ClientSession,
+    limiter: RateLimiter,
+    url: str,
+    params: Optional[dict] = None,
+    headers: Optional[dict] = None
+) -> Optional[str]:
+    """
+    GET a URL through the rate limiter, backing off exponentially
+    (or per the Retry-After header) on 429 and 5xx responses.
+    """
+    for attempt in range(MAX_RETRIES):
+        await limiter.wait()
+
+        async with session.get(url, params=params, headers=headers) as response:
+            if response.status == 429 or response.status >= 500:
+                if attempt == MAX_RETRIES - 1:
+                    break
+
+                try:
+                    delay = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    delay = 2 ** attempt
+
+                logging.debug(f"HTTP {response.status} for {url}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay + random.uniform(0, 0.5))
+                continue
+
+            response.raise_for_status()
+            return await response.text()
+
+    logging.warning(f"Giving up on {url} after {MAX_RETRIES} attempts")
+    return None
+
+
+async def search_song(
+    session: aiohttp.ClientSession,
+    limiter: RateLimiter,
+    token: str,
     title: str,
     artist: str
 ) -> Optional[str]:
-    """Fetch cleaned lyrics from Genius."""
-    try:
-        clean_title = clean_track_title(title)
-        clean_artist = clean_artist_name(artist)
+    """Return the Genius page URL of the best matching song."""
+    body = await genius_get(
+        session,
+        limiter,
+        f"{GENIUS_API_URL}/search",
+        params={"q": f"{title} {artist}".strip()},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    if body is None:
+        return None
 
-        if not clean_title:
+    songs = [
+        hit["result"]
+        for hit in json.loads(body)["response"]["hits"]
+        if hit.get("type") == "song"
+        and not _NON_SONG_RE.search(hit["result"].get("title", ""))
+    ]
+    if not songs:
+        return None
+
+    # Prefer an exact title match, otherwise take the top hit
+    for song in songs:
+        if song.get("title", "").lower() == title.lower():
+            return song["url"]
+
+    return songs[0]["url"]
+
+
+def extract_lyrics(html: str) -> str:
+    """Pull raw lyrics text out of a Genius song page."""
+    soup = BeautifulSoup(html, "html.parser")
+    parts = []
+
+    for container in soup.select("div[data-lyrics-container='true']"):
+        for br in container.find_all("br"):
+            br.replace_with("\n")
+        parts.append(container.get_text())
+
+    return "\n".join(parts)
+
+
+def cache_key(title: str, artist: str) -> str:
+    return f"{title.lower()}||{artist.lower()}"
+
+
+async def fetch_lyrics(
+    session: aiohttp.ClientSession,
+    limiter: RateLimiter,
+    token: str,
+    cache: shelve.Shelf,
+    title: str,
+    artist: str
+) -> Optional[str]:
+    """Fetch cleaned lyrics from the local cache or Genius."""
+    try:
+        if not title:
             return None
 
-        logging.info(f"Fetching: '{clean_title}' by '{clean_artist}'")
+        key = cache_key(title, artist)
+        if key in cache:
+            return cache[key]["lyrics"]
+
+        logging.info(f"Fetching: '{title}' by '{artist}'")
 
-        song = genius.search_song(clean_title, clean_artist or None)
+        url = await search_song(session, limiter, token, title, artist)
+        if not url:
+            return None
 
-        if song and song.lyrics:
-            lyrics = clean_lyrics(song.lyrics, clean_title)
-            return lyrics if lyrics else None
+        html = await genius_get(session, limiter, url)
+        if not html:
+            return None
 
-        return None
+        lyrics = clean_lyrics(extract_lyrics(html), title)
+        if not lyrics:
+            return None
+
+        cache[key] = {
+            "title": title,
+            "artist": artist,
+            "lyrics": lyrics,
+            "fetched_at": datetime.now(timezone.utc).isoformat()
+        }
+        return lyrics
 
     except Exception as e:
         logging.debug(f"Error fetching '{title}' by '{artist}': {e}")
         return None
 
 
+async def fetch_all_lyrics(
+    token: str,
+    tracks: List[Tuple[str, str]]
+) -> List[Optional[str]]:
+    """
+    Fetch lyrics for all cleaned (title, artist) pairs concurrently, in order.
+    Each distinct pair is looked up once; successful lookups persist
+    in CACHE_FILE across runs.
+    """
+    limiter = RateLimiter(MAX_REQUESTS_PER_SECOND)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    keys = [cache_key(title, artist) for title, artist in tracks]
+    unique_tracks = {}  # cache key -> first (title, artist) seen
+    for key, track in zip(keys, tracks):
+        unique_tracks.setdefault(key, track)
+
+    logging.info(f"Unique tracks to look up: {len(unique_tracks):,}")
+
+    with shelve.open(CACHE_FILE) as cache:
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        ) as session:
+
+            async def bounded_fetch(title: str, artist: str) -> Optional[str]:
+                async with semaphore:
+                    return await fetch_lyrics(session, limiter, token, cache, title, artist)
+
+            results = await asyncio.gather(
+                *(bounded_fetch(title, artist) for title, artist in unique_tracks.values())
+            )
+
+    lyrics_by_key = dict(zip(unique_tracks, results))
+    return [lyrics_by_key[key] for key in keys]
+
+
 # =========================
 # Main Pipeline
 # =========================
@@ -152,7 +336,7 @@ def main():
         raise FileNotFoundError(f"{INPUT_FILE} not found.")
 
     logging.info("Loading dataset...")
-    df = pd.read_excel(INPUT_FILE)
+    df = load_dataset(INPUT_FILE)
 
     if len(df.columns) < 2:
         raise ValueError("Dataset must contain at least track and artist columns.")
@@ -164,24 +348,19 @@ def main():
     logging.info(f"Using columns -> track: '{track_col}', artist: '{artist_col}'")
     logging.info(f"Total rows to process: {len(df):,}")
 
-    genius = authenticate_genius()
-
-    lyrics_list: List[Optional[str]] = []
-
-    for index, row in df.iterrows():
-        title = row[track_col]
-        artist = row[artist_col]
+    token = authenticate_genius()
 
-        lyrics = fetch_lyrics(genius, title, artist)
-        lyrics_list.append(lyrics)
+    titles = clean_track_titles(df[track_col])
+    artists = clean_artist_names(df[artist_col])
 
-        time.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
+    tracks = list(zip(titles, artists))
+    lyrics_list = asyncio.run(fetch_all_lyrics(token, tracks))
 
     # Replace or create lyrics column
     df["lyrics"] = lyrics_list
 
     logging.info("Saving enriched dataset...")
-    df.to_excel(OUTPUT_FILE, index=False)
+    save_dataset(df, OUTPUT_FILE)
 
     logging.info("Lyrics enrichment complete.")
     logging.info(f"Output saved to {OUTPUT_FILE}")
@@ -189,4 +368,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
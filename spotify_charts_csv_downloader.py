@@ -2,20 +2,34 @@
 Spotify Charts Scraper
 
 Automates downloading daily Spotify Global Top 200 CSV files
-from charts.spotify.com using Selenium.
+from charts.spotify.com using Selenium. After a manual login, dates
+are fetched directly over HTTPS when SPOTIFY_CHARTS_CSV_URL is set,
+and otherwise split across a pool of headless browsers sharing the
+session.
 """
 
 import os
 import time
 import random
+import queue
+import shutil
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from http.cookies import Morsel
+from typing import Dict, List
+
+import aiohttp
+from yarl import URL
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import TimeoutException
+from watchdog.events import PatternMatchingEventHandler
+from watchdog.observers import Observer
 from webdriver_manager.chrome import ChromeDriverManager
 
 
@@ -23,6 +37,7 @@ from webdriver_manager.chrome import ChromeDriverManager
 # Configuration
 # =========================
 
+CHARTS_HOME_URL = "https://charts.spotify.com"
 LOGIN_URL = "https://charts.spotify.com/login"
 BASE_CHART_URL = "https://charts.spotify.com/charts/view/regional-global-daily"
 
@@ -30,7 +45,16 @@ DOWNLOAD_FOLDER = "downloads"
 START_DATE = "2025-01-01"
 END_DATE = "2025-12-31"
 
+NUM_WORKERS = 4  # Parallel headless browsers
+
+# Optional direct CSV endpoint, e.g. "https://.../{date}/download".
+# When set, dates are fetched over HTTPS with the login cookies and
+# Selenium only handles the dates that fail.
+CSV_DOWNLOAD_URL = os.getenv("SPOTIFY_CHARTS_CSV_URL")
+DIRECT_CONCURRENCY = 16
+
 LOGIN_WAIT_TIME = 60
+DOWNLOAD_BUTTON_TIMEOUT = 15
 MIN_DELAY = 3
 MAX_DELAY = 6
 
@@ -53,10 +77,27 @@ logging.basicConfig(
 # Utility Functions
 # =========================
 
-def setup_driver(download_folder: str):
+def get_chromedriver_path() -> str:
+    """
+    Resolve ChromeDriver once per process.
+    Set CHROMEDRIVER_PATH to skip webdriver-manager's network check entirely.
+    """
+    driver_path = os.environ.get("CHROMEDRIVER_PATH")
+
+    if not driver_path or not os.path.exists(driver_path):
+        driver_path = ChromeDriverManager().install()
+        os.environ["CHROMEDRIVER_PATH"] = driver_path
+
+    return driver_path
+
+
+def setup_driver(download_folder: str, headless: bool = False):
     """Initialize Chrome WebDriver with download preferences."""
     options = webdriver.ChromeOptions()
 
+    if headless:
+        options.add_argument("--headless=new")
+
     prefs = {
         "download.default_directory": os.path.abspath(download_folder),
         "download.prompt_for_download": False,
@@ -66,7 +107,7 @@ def setup_driver(download_folder: str):
 
     options.add_experimental_option("prefs", prefs)
 
-    service = Service(ChromeDriverManager().install())
+    service = Service(get_chromedriver_path())
     driver = webdriver.Chrome(service=service, options=options)
 
     return driver
@@ -79,6 +120,23 @@ def wait_for_manual_login(driver, wait_time: int):
     logging.info("Login wait complete.")
 
 
+def setup_worker_driver(download_folder: str, cookies: List[Dict]):
+    """Start a headless driver that reuses the logged-in session cookies."""
+    driver = setup_driver(download_folder, headless=True)
+    driver.get(CHARTS_HOME_URL)
+
+    for cookie in cookies:
+        try:
+            driver.add_cookie({
+                key: value for key, value in cookie.items()
+                if key in ("name", "value", "domain", "path", "secure", "httpOnly", "expiry")
+            })
+        except Exception:
+            logging.debug(f"Skipping cookie {cookie.get('name')} for {cookie.get('domain')}")
+
+    return driver
+
+
 def generate_dates(start_date: str, end_date: str):
     """Generate date strings between start and end date."""
     start = datetime.strptime(start_date, "%Y-%m-%d")
@@ -93,11 +151,9 @@ def generate_dates(start_date: str, end_date: str):
 def click_download_button(driver) -> bool:
     """Attempt to locate and click the CSV download button."""
     try:
-        wait = WebDriverWait(driver, 10)
-        wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-        time.sleep(2)
-
-        button = driver.find_element(By.XPATH, "//button[@aria-labelledby='csv_download']")
+        button = WebDriverWait(driver, DOWNLOAD_BUTTON_TIMEOUT).until(
+            EC.element_to_be_clickable((By.XPATH, "//button[@aria-labelledby='csv_download']"))
+        )
         driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", button)
         button.click()
 
@@ -108,75 +164,237 @@ def click_download_button(driver) -> bool:
         return False
 
 
-def rename_latest_csv(download_folder: str, date_str: str, timeout: int = 10):
-    """Rename most recent CSV file to match date."""
-    start_time = time.time()
+class CsvDownloadHandler(PatternMatchingEventHandler):
+    """Queue the path of every completed CSV download in a watched folder."""
+
+    def __init__(self, events: queue.Queue):
+        super().__init__(patterns=["*.csv"], ignore_directories=True)
+        self.events = events
 
-    while time.time() - start_time < timeout:
-        files = [
-            f for f in os.listdir(download_folder)
-            if f.endswith(".csv")
-        ]
+    def on_moved(self, event):
+        # Chrome renames "*.crdownload" to the final name once complete.
+        # Created events are ignored: the final name can appear as an
+        # empty placeholder before the download has finished.
+        if event.src_path.endswith(".crdownload") and event.dest_path.endswith(".csv"):
+            self.events.put(event.dest_path)
 
-        if files:
-            files.sort(
-                key=lambda f: os.path.getmtime(os.path.join(download_folder, f)),
-                reverse=True
-            )
 
-            latest = files[0]
-            source_path = os.path.join(download_folder, latest)
-            target_path = os.path.join(download_folder, f"{date_str}.csv")
+def clear_events(events: queue.Queue):
+    """Drop stale download events before starting a new download."""
+    while True:
+        try:
+            events.get_nowait()
+        except queue.Empty:
+            return
 
-            if not os.path.exists(target_path):
-                os.rename(source_path, target_path)
-                return True
 
-        time.sleep(0.5)
+def rename_downloaded_csv(
+    events: queue.Queue,
+    target_folder: str,
+    date_str: str,
+    timeout: int = 10
+) -> bool:
+    """Wait for the next downloaded CSV and move it to {date}.csv."""
+    try:
+        source_path = events.get(timeout=timeout)
+    except queue.Empty:
+        logging.warning(f"Could not rename file for {date_str}")
+        return False
 
-    logging.warning(f"Could not rename file for {date_str}")
-    return False
+    target_path = os.path.join(target_folder, f"{date_str}.csv")
+
+    if os.path.exists(target_path):
+        logging.warning(f"{target_path} already exists, leaving {source_path}")
+        return False
+
+    try:
+        shutil.move(source_path, target_path)
+    except OSError as e:
+        logging.warning(f"Could not move {source_path} for {date_str}: {e}")
+        return False
+
+    return True
+
+
+def cleanup_worker_folders(worker_folders: List[str]):
+    """Remove worker folders, keeping any that hold unrenamed downloads."""
+    for folder in worker_folders:
+        if not os.path.isdir(folder):
+            continue
+
+        if os.listdir(folder):
+            logging.warning(f"Leaving unrenamed downloads in {folder}")
+        else:
+            os.rmdir(folder)
 
 
 # =========================
-# Main Workflow
+# Direct Download
 # =========================
 
-def main():
+async def download_csv_direct(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    download_folder: str,
+    date_str: str
+) -> bool:
+    """Fetch one day's CSV over HTTPS and write it straight to {date}.csv."""
+    url = CSV_DOWNLOAD_URL.format(date=date_str)
 
-    os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+    async with semaphore:
+        try:
+            async with session.get(url) as response:
+                content_type = response.headers.get("Content-Type", "")
+                if response.status != 200 or "csv" not in content_type:
+                    logging.warning(f"Direct download failed for {date_str} (HTTP {response.status})")
+                    return False
 
-    driver = setup_driver(DOWNLOAD_FOLDER)
+                data = await response.read()
 
-    try:
-        driver.get(LOGIN_URL)
-        wait_for_manual_login(driver, LOGIN_WAIT_TIME)
+        except aiohttp.ClientError as e:
+            logging.warning(f"Direct download failed for {date_str}: {e}")
+            return False
 
-        dates = list(generate_dates(START_DATE, END_DATE))
-        logging.info(f"Processing {len(dates)} dates.")
+    with open(os.path.join(download_folder, f"{date_str}.csv"), "wb") as f:
+        f.write(data)
 
-        for index, date_str in enumerate(dates, start=1):
+    return True
+
+
+def build_cookie_jar(cookies: List[Dict]) -> aiohttp.CookieJar:
+    """Load Selenium cookies into a jar, keeping each cookie's domain and path."""
+    jar = aiohttp.CookieJar()
+
+    for cookie in cookies:
+        domain = cookie["domain"]
+
+        # Set the coded value explicitly so SimpleCookie does not quote
+        # values containing characters like "/" or "="
+        morsel = Morsel()
+        morsel.set(cookie["name"], cookie["value"], cookie["value"])
+        morsel["path"] = cookie.get("path", "/")
+
+        # A leading dot marks a domain cookie; otherwise it is host-only
+        if domain.startswith("."):
+            morsel["domain"] = domain
+        if cookie.get("secure"):
+            morsel["secure"] = True
 
-            file_path = os.path.join(DOWNLOAD_FOLDER, f"{date_str}.csv")
-            if os.path.exists(file_path):
-                logging.info(f"Skipping {date_str} (already exists)")
-                continue
+        jar.update_cookies(
+            {cookie["name"]: morsel},
+            response_url=URL(f"https://{domain.lstrip('.')}/")
+        )
+
+    return jar
+
+
+async def download_all_direct(
+    cookies: List[Dict],
+    download_folder: str,
+    dates: List[str]
+) -> List[str]:
+    """Download all dates concurrently; return the dates that failed."""
+    semaphore = asyncio.Semaphore(DIRECT_CONCURRENCY)
+    async with aiohttp.ClientSession(cookie_jar=build_cookie_jar(cookies)) as session:
+        results = await asyncio.gather(*(
+            download_csv_direct(session, semaphore, download_folder, date_str)
+            for date_str in dates
+        ))
+
+    return [date_str for date_str, ok in zip(dates, results) if not ok]
+
+
+# =========================
+# Main Workflow
+# =========================
+
+def download_worker(worker_id: int, download_folder: str, dates: List[str], cookies: List[Dict]):
+    """Download a shard of dates in its own headless browser."""
+    events: queue.Queue = queue.Queue()
+    observer = Observer()
+    observer.schedule(CsvDownloadHandler(events), download_folder)
+    observer.start()
+
+    driver = setup_worker_driver(download_folder, cookies)
+
+    try:
+        for index, date_str in enumerate(dates, start=1):
 
             url = f"{BASE_CHART_URL}/{date_str}"
             driver.get(url)
 
+            clear_events(events)
             if click_download_button(driver):
-                rename_latest_csv(DOWNLOAD_FOLDER, date_str)
+                rename_downloaded_csv(events, DOWNLOAD_FOLDER, date_str)
+
+            logging.info(f"Worker {worker_id}: {index}/{len(dates)} dates done.")
 
             if index < len(dates):
                 delay = random.uniform(MIN_DELAY, MAX_DELAY)
                 time.sleep(delay)
 
-        logging.info("Download process completed.")
+    finally:
+        driver.quit()
+        observer.stop()
+        observer.join()
+
+
+def main():
+
+    os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+
+    driver = setup_driver(DOWNLOAD_FOLDER)
+
+    try:
+        driver.get(LOGIN_URL)
+        wait_for_manual_login(driver, LOGIN_WAIT_TIME)
+        cookies = driver.get_cookies()
 
     finally:
         driver.quit()
 
+    dates = []
+    for date_str in generate_dates(START_DATE, END_DATE):
+        file_path = os.path.join(DOWNLOAD_FOLDER, f"{date_str}.csv")
+        if os.path.exists(file_path):
+            logging.info(f"Skipping {date_str} (already exists)")
+            continue
+        dates.append(date_str)
+
+    logging.info(f"Processing {len(dates)} dates.")
+
+    if CSV_DOWNLOAD_URL and dates:
+        dates = asyncio.run(download_all_direct(cookies, DOWNLOAD_FOLDER, dates))
+        logging.info(f"{len(dates)} dates left for browser download.")
+
+    shards = [dates[i::NUM_WORKERS] for i in range(NUM_WORKERS)]
+    shards = [shard for shard in shards if shard]
+
+    worker_folders = [
+        os.path.join(DOWNLOAD_FOLDER, f"worker{i}")
+        for i in range(len(shards))
+    ]
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(shards), 1)) as executor:
+            futures = []
+            for worker_id, (folder, shard) in enumerate(zip(worker_folders, shards)):
+                os.makedirs(folder, exist_ok=True)
+                futures.append(
+                    executor.submit(download_worker, worker_id, folder, shard, cookies)
+                )
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Worker failed: {e}")
+
+    finally:
+        cleanup_worker_folders(worker_folders)
+
+    logging.info("Download process completed.")
+
 
 if __name__ == "__main__":
     main()